@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
 import logging
 import sys
 import os
 import curses
+import pickle
 import glob
+import hashlib
 import re
+import shlex
 import subprocess
 import fnmatch
 import tempfile
@@ -53,6 +57,11 @@ DirType = TypedDict('DirType', {
 TreeType = list[FileType | DirType]
 ContextType = list[str]
 
+# LUTs of the files and dirs of a tree, by name, indexed by id() of the tree.
+# We keep a reference to the tree itself, to make sure its id() stays unique.
+TreeLutsType = dict[
+    int, tuple[TreeType, dict[str, FileType], dict[str, DirType]]]
+
 OverlayType = TypedDict('OverlayType', {
     'when-any': list[str],
     'when-all': list[str],
@@ -65,25 +74,14 @@ ConfigType = TypedDict('ConfigType', {
     'overlays': list[OverlayType]},
     total=False)
 
-try:
-    from packaging import version
-except ImportError:
-    print('No packaging. You should install python3-packaging...')
-
-# Not all yaml versions have a Loader argument.
-if 'packaging.version' in sys.modules and \
-   version.parse(yaml.__version__) >= version.parse('5.1'):
-    yaml_load_args = {'Loader': yaml.FullLoader}
-else:
-    yaml_load_args = {}
-
 # Colors
+# We skip the terminfo lookup when NO_COLOR is set (see https://no-color.org).
 normal = ''
 red = ''
 yellow = ''
 green = ''
 
-if os.isatty(sys.stdout.fileno()):
+if not os.environ.get('NO_COLOR') and os.isatty(sys.stdout.fileno()):
     try:
         curses.setupterm()
         setafb = curses.tigetstr('setaf') or bytes()
@@ -96,34 +94,34 @@ if os.isatty(sys.stdout.fileno()):
     except Exception:
         pass
 
-# guid-tool.py command.
+# guid-tool.py command, as a list of arguments.
 # This will be set after command line argument parsing.
-guid_tool = None
+guid_tool: Optional[list[str]] = None
 
-# capsule-tool.py command.
+# capsule-tool.py command, as a list of arguments.
 # This will be set after command line argument parsing.
-capsule_tool = None
+capsule_tool: Optional[list[str]] = None
 
 # dtc command.
 # This will be set after command line argument parsing.
 dtc = None
 
-# dt-parser.py command.
+# dt-parser.py command, as a list of arguments.
 # This will be set after command line argument parsing.
-dt_parser = None
+dt_parser: Optional[list[str]] = None
 
-# ethernet-parser.py command.
+# ethernet-parser.py command, as a list of arguments.
 # This will be set after command line argument parsing.
-ethernet_parser = None
+ethernet_parser: Optional[list[str]] = None
 num_eth_devices = None
 
 # dt-validate command.
 # This will be set after command line argument parsing.
 dt_validate = None
 
-# (SCT) parser.py command.
+# (SCT) parser.py command, as a list of arguments.
 # This will be set after command line argument parsing.
-parser = None
+parser: Optional[list[str]] = None
 
 # compatibles command.
 # This will be set after command line argument parsing.
@@ -154,14 +152,14 @@ esrt_guids = set()
 # Capsule GUIDs.
 # This is populated when checking capsules, and is used during deferred checks
 # to verify against ESRT GUIDs.
-# Entries are dicts with keys 'guid' and 'filename'.
-capsule_guids = []
+# Entries are (guid, filename) tuples.
+capsule_guids: list[tuple[guid.Guid, str]] = []
 
 # Partitions device paths.
 # This is populated when checking UEFI logs, and is used during deferred checks
 # to verify against ESPs.
-# Entries are dicts with keys 'dev-path' and 'filename'.
-dev_paths = []
+# Entries are (dev-path, filename) tuples.
+dev_paths: list[tuple[str, str]] = []
 
 # ESPs device paths.
 # This is populated when checking the UEFI sniff test log, and is used later on
@@ -185,6 +183,12 @@ BINDINGS_REL_PATH: Final = 'bindings'
 # Compatible strings file relative path under the cache folder.
 COMPAT_REL_PATH: Final = 'compatible-strings.txt'
 
+# Glob special characters; those are the ones glob.escape() escapes.
+GLOB_META: Final = frozenset('*?[')
+
+# Configuration file entries, whose checks can create files.
+FILE_CREATING_KEYS: Final = ('devicetree', 'sct-parser-result-md')
+
 # The set of files and dirs, which were not checked.
 # This is printed in debug mode, to help create the configuration file.
 not_checked = set()
@@ -214,6 +218,8 @@ def maybe_plural(n: int, word: str) -> str:
 
 # A class to account for statistics
 class Stats:
+    __slots__ = ('data',)
+
     COUNTERS: Final = ['check', 'pass', 'warning', 'error']
 
     COLORS: Final = {
@@ -223,10 +229,7 @@ class Stats:
     }
 
     def __init__(self) -> None:
-        self.data = {}
-
-        for c in Stats.COUNTERS:
-            self.data[c] = 0
+        self.data = dict.fromkeys(Stats.COUNTERS, 0)
 
     def _counter_str(self, x: str) -> str:
         n = self.data[x]
@@ -362,14 +365,62 @@ def get_compat() -> str:
     return get_linux_cache() + f"/{COMPAT_REL_PATH}"
 
 
+# Save a parsed configuration to the cache.
+# We write to a temporary file and rename it, so that readers never see a
+# partial file, and we remove the older cache entries for the same key.
+def cache_config(y: Any, cached: str, key: str) -> None:
+    logging.debug(f"Caching `{cached}'")
+    dirname = os.path.dirname(cached)
+
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'wb') as picklefile:
+                pickle.dump(y, picklefile)
+
+            os.replace(tmp, cached)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        for x in glob.glob(f"{glob.escape(dirname)}/{glob.escape(key)}.*"):
+            if x != cached and x.endswith('.pickle'):
+                logging.debug(f"Removing `{x}'")
+                os.unlink(x)
+    except OSError as e:
+        logging.debug(f"Could not cache `{cached}' ({e})")
+
+
 # Load YAML configuration file.
 # See the README.md for details on the file format.
+# We cache the parsed configuration under cache_dir, keyed on the file real
+# path and validated with its size and modification time, as unpickling is
+# faster than parsing YAML.
 def load_config(filename: str) -> ConfigType:
     logging.debug(f'Load {filename}')
+    st = os.stat(filename)
+    path = os.path.realpath(filename)
+    h = hashlib.sha256(path.encode()).hexdigest()[:16]
+    key = f"{os.path.basename(path)}.{h}"
+    cached = f"{cache_dir}/{key}.{st.st_size}.{st.st_mtime_ns}.pickle"
+
+    try:
+        with open(cached, 'rb') as picklefile:
+            y = pickle.load(picklefile)
+
+        logging.debug(f"Cache hit for `{cached}'")
+    except Exception as e:
+        # A damaged cache file can raise about anything; parse the YAML then.
+        logging.debug(f"Cache miss for `{cached}' ({e})")
+
+        with open(filename, 'rb') as yamlfile:
+            y = yaml.load(yamlfile, Loader=yaml.CSafeLoader)
 
-    with open(filename, 'r') as yamlfile:
-        y = yaml.load(yamlfile, **yaml_load_args)
-        conf = cast(Optional[ConfigType], y)
+        cache_config(y, cached, key)
+
+    conf = cast(Optional[ConfigType], y)
 
     if conf is None:
         conf = {
@@ -502,9 +553,21 @@ def error_if_contains(strings: list[str], filename: str) -> Stats:
 
 
 # subprocess.run() wrapper
-def run(cmd: str) -> subprocess.CompletedProcess[bytes]:
-    logging.debug(f"Running {cmd}")
-    cp = subprocess.run(cmd, shell=True, capture_output=True, check=False)
+# We run cmd with the shell when it is a string. When it is a list we run it
+# directly, without shell.
+# We run cmd in the cwd directory, when specified.
+# We decode the outputs as UTF-8 once here.
+def run(
+        cmd: str | list[str], cwd: Optional[str] = None
+        ) -> subprocess.CompletedProcess[str]:
+
+    shell = isinstance(cmd, str)
+    logging.debug(f"Running {cmd if shell else shlex.join(cmd)}")
+
+    cp = subprocess.run(
+        cmd, shell=shell, capture_output=True, check=False, encoding='utf-8',
+        errors='replace', cwd=cwd)
+
     logging.debug(cp)
     return cp
 
@@ -534,7 +597,8 @@ def maybe_check_archive(filename: str) -> Stats:
 def identify_guid(guid: guid.Guid, message: str = '') -> Stats:
     logging.debug(f"Identify GUID {guid}")
     stats = Stats()
-    cp = run(f"{guid_tool} {guid}")
+    assert guid_tool is not None
+    cp = run([*guid_tool, str(guid)])
 
     if cp.returncode:
         # This could be a malformed GUID so deal with it gracefully.
@@ -544,7 +608,7 @@ def identify_guid(guid: guid.Guid, message: str = '') -> Stats:
         stats.inc_error()
 
     else:
-        o = cp.stdout.decode().rstrip()
+        o = cp.stdout.rstrip()
 
         if o == 'Unknown':
             logging.info(f"GUID `{guid}' {green}unknown{normal}{message}")
@@ -592,16 +656,17 @@ def check_capsuleapp_esrt(filename: str) -> Stats:
 def check_uefi_capsule(filename: str) -> Stats:
     logging.debug(f"Check UEFI Capsule `{filename}'")
     stats = Stats()
-    cp = run(f"{capsule_tool} --print-guid '{filename}'")
+    assert capsule_tool is not None
+    cp = run([*capsule_tool, '--print-guid', filename])
 
     if cp.returncode:
         logging.error(f"Capsule tool {red}failed{normal} on `{filename}'")
         stats.inc_error()
         return stats
 
-    o = cp.stdout.decode().splitlines()
+    o = cp.stdout.splitlines()
     logging.debug(o)
-    e = cp.stderr.decode()
+    e = cp.stderr
 
     # Authenticated capsule in FMP format.
     if o[0] == 'Valid authenticated capsule in FMP format':
@@ -618,7 +683,7 @@ def check_uefi_capsule(filename: str) -> Stats:
         logging.debug(f"Capsule image type GUID is `{g}'")
 
         # Record the GUID for deferred check against the ESRT.
-        capsule_guids.append({'guid': g, 'filename': filename})
+        capsule_guids.append((g, filename))
 
     else:
         logging.error(
@@ -735,19 +800,20 @@ def check_devicetree(filename: str) -> Stats:
     # We use the compatible strings extracted from Linux bindings to filter out
     # more false positive.
     compat = get_compat()
-    cp = run(f"{dt_parser} --compatibles '{compat}' '{log}'")
+    assert dt_parser is not None
+    cp = run([*dt_parser, '--compatibles', compat, log])
 
     if cp.returncode:
         logging.error(f"dt-parser {red}failed{normal} on `{log}'!")
         stats.inc_error()
         return stats
 
-    if re.search(r'Unparsed line', cp.stderr.decode()):
+    if re.search(r'Unparsed line', cp.stderr):
         logging.warning(
             f"dt-parser reports {yellow}unparsed{normal} with `{log}'!")
         stats.inc_warning()
 
-    t = cp.stdout.decode().splitlines()
+    t = cp.stdout.splitlines()
     logging.debug(t)
 
     # Look for Summary line.
@@ -905,7 +971,7 @@ def check_must_have_esp(filename: str) -> Stats:
 
         # Record the device path(s) for deferred check against the ESPs.
         for x in dp:
-            dev_paths.append({'dev-path': x, 'filename': filename})
+            dev_paths.append((x, filename))
 
     else:
         logging.error(
@@ -958,7 +1024,7 @@ def check_report_txt(filename: str) -> Stats:
 def sct_parser(conffile: SctParserResultMdType, filename: str) -> None:
     logging.debug(f"SCT parser `{filename}'")
     assert parser is not None
-    which_parser = which(parser)
+    which_parser = which(parser[0])
 
     if which_parser is None:
         logging.debug('No parser')
@@ -977,7 +1043,7 @@ def sct_parser(conffile: SctParserResultMdType, filename: str) -> None:
     if not need_regen(filename, [f"{d}/{seq}", f"{d}/{ekl}", which_parser]):
         return
 
-    cp = run(f"cd '{d}' && {parser} {ekl} '{seq}'")
+    cp = run([*parser, ekl, seq], cwd=d)
 
     if cp.returncode:
         logging.warning(f"SCT parser {yellow}failed{normal} `{filename}'")
@@ -1185,8 +1251,39 @@ def check_dir(confdir: DirType, confpath: str, dirname: str) -> Stats:
 
 # Return True if a string is a glob pattern, False otherwise.
 def is_glob(x: str) -> bool:
-    e = glob.escape(x)
-    return x != e
+    return not GLOB_META.isdisjoint(x)
+
+
+# List the names of the entries of a directory.
+# We return an empty list in case of error, like glob.glob() would.
+def list_dir(dirname: str) -> list[str]:
+    try:
+        with os.scandir(dirname or os.curdir) as it:
+            return [e.name for e in it]
+    except OSError:
+        return []
+
+
+# Expand a glob pattern, like glob.glob().
+# We list each directory only once, and keep the listings in the listings dict.
+# Like glob.glob(), we hide the entries starting with a dot unless the pattern
+# starts with a dot.
+# We fall back to glob.glob() when the directory part is a glob pattern, too.
+def expand_glob(pathname: str, listings: dict[str, list[str]]) -> list[str]:
+    head, tail = os.path.split(pathname)
+
+    if not tail or glob.has_magic(head):
+        return glob.glob(pathname)
+
+    if head not in listings:
+        listings[head] = list_dir(head)
+
+    names = listings[head]
+
+    if tail[0] != '.':
+        names = [n for n in names if n[0] != '.']
+
+    return [os.path.join(head, n) for n in fnmatch.filter(names, tail)]
 
 
 # Try to identify the results.
@@ -1194,17 +1291,17 @@ def is_glob(x: str) -> bool:
 # Return the list of identified files and the SystemReady version
 # or [], None in case of error.
 def run_identify(
-        dirname: str, identify: str) -> tuple[list[str], Optional[str]]:
+        dirname: str, identify: list[str]) -> tuple[list[str], Optional[str]]:
 
     logging.debug(f"Identify {dirname}")
 
-    cp = run(f"{identify} --dir '{dirname}' --known-files")
+    cp = run([*identify, '--dir', dirname, '--known-files'])
 
     if cp.returncode:
-        logging.error(f"{red}Bad identify{normal} `{identify}'")
+        logging.error(f"{red}Bad identify{normal} `{shlex.join(identify)}'")
         sys.exit(1)
 
-    o = cp.stdout.decode().splitlines()
+    o = cp.stdout.splitlines()
     logging.debug(o)
 
     if o is not None and len(o) and 'Unknown' not in o[-1]:
@@ -1221,6 +1318,20 @@ def run_identify(
     return [], None
 
 
+# Check if a tree entry can create files when checked.
+# The SCT parser and the Devicetree check can create files, possibly deep down
+# in a sub-tree.
+def creates_files(e: FileType | DirType) -> bool:
+    if any(k in e for k in FILE_CREATING_KEYS):
+        return True
+
+    if 'tree' in e:
+        d = cast(DirType, e)
+        return any(creates_files(x) for x in d['tree'])
+
+    return False
+
+
 # Recursively check a tree
 # We return a Stats object.
 # Files and directories names may be glob patterns. We need to handle the case
@@ -1229,6 +1340,7 @@ def check_tree(conftree: TreeType, confpath: str, dirname: str) -> Stats:
     logging.debug(f"Check `{dirname}/' ({confpath})")
     assert isinstance(conftree, list)
     stats = Stats()
+    listings: dict[str, list[str]] = {}
 
     for e in conftree:
         if 'file' in e:
@@ -1243,7 +1355,7 @@ def check_tree(conftree: TreeType, confpath: str, dirname: str) -> Stats:
             raise Exception
 
         if is_glob(pathname):
-            t = list(glob.glob(pathname))
+            t = expand_glob(pathname, listings)
             logging.debug(f"{pathname} -> {t}")
 
             if len(t) == 0 and 'optional' not in e:
@@ -1260,6 +1372,11 @@ def check_tree(conftree: TreeType, confpath: str, dirname: str) -> Stats:
                 d = cast(DirType, e)
                 stats.add(check_dir(d, p, x))
 
+        # Checking this entry may have created files, so we need to list
+        # again.
+        if creates_files(e):
+            listings.clear()
+
     return stats
 
 
@@ -1273,17 +1390,14 @@ def deferred_check_capsule_guids_in_esrt() -> Stats:
     logging.debug(f"Capsule GUIDs: {capsule_guids}")
     logging.debug(f"ESRT GUIDs: {esrt_guids}")
 
-    for x in capsule_guids:
-        guid = x['guid']
-        filename = x['filename']
-
-        if guid in esrt_guids:
+    for g, filename in capsule_guids:
+        if g in esrt_guids:
             logging.debug(
-                f"GUID `{guid}' from `{filename}' {green}in ESRT{normal}")
+                f"GUID `{g}' from `{filename}' {green}in ESRT{normal}")
             stats.inc_pass()
         else:
             logging.error(
-                f"GUID `{guid}' from `{filename}' {red}not in ESRT{normal}")
+                f"GUID `{g}' from `{filename}' {red}not in ESRT{normal}")
             stats.inc_error()
 
     return stats
@@ -1301,10 +1415,7 @@ def deferred_check_uefi_logs_esp() -> Stats:
     logging.debug(f"Device path(s): {dev_paths}")
     filenames = {}
 
-    for x in dev_paths:
-        filename = x['filename']
-        dev_path = x['dev-path']
-
+    for dev_path, filename in dev_paths:
         if filename not in filenames:
             logging.debug(f"`{filename}' must have an ESP")
             filenames[filename] = False
@@ -1419,9 +1530,17 @@ def deferred_check_ethernet() -> Stats:
         stats.inc_error()
         return stats
 
-    for filename in ethernets:
+    # The ethernet-parser runs are independent, so we run them in parallel and
+    # check their results in order.
+    filenames = list(ethernets)
+    assert ethernet_parser is not None
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        cps = list(executor.map(
+            run, [[*ethernet_parser, f, str(neth)] for f in filenames]))
+
+    for filename, cp in zip(filenames, cps):
         logging.debug(f"Check Ethernet `{filename}'")
-        cp = run(f"{ethernet_parser} {filename} {neth}")
 
         if cp.returncode:
             logging.error(
@@ -1484,61 +1603,72 @@ def check_dt_validate() -> None:
         logging.error(f"{red}Bad {dt_validate}{normal}")
         sys.exit(1)
 
-    meta_data['dt-validate-version'] = cp.stdout.decode().rstrip()
+    meta_data['dt-validate-version'] = cp.stdout.rstrip()
 
 
 # Check that we have all we need.
+# The probe commands are independent, so we run them all in parallel and then
+# check their results in order.
 def check_prerequisites() -> None:
     logging.debug('Checking prerequisites')
+    assert guid_tool is not None
+    assert capsule_tool is not None
+    assert dt_parser is not None
+
+    probes: dict[str, str | list[str]] = {
+        'tar': 'tar --version',
+        'guid-tool': [*guid_tool, '-h'],
+        'capsule-tool': [*capsule_tool, '-h'],
+        'dtc': f"{dtc} --version",
+        'dt-parser': [*dt_parser, '-h'],
+        'compatibles': f"{compatibles} -h",
+    }
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(probes)) as executor:
+        cps = dict(zip(probes.keys(), executor.map(run, probes.values())))
 
     # Check that we have tar.
-    cp = run('tar --version')
+    cp = cps['tar']
 
     if cp.returncode:
         logging.error(f"{red}tar not found{normal}")
         sys.exit(1)
 
-    meta_data['tar-version'] = cp.stdout.decode().splitlines()[0]
+    meta_data['tar-version'] = cp.stdout.splitlines()[0]
 
     # Check that we have guid-tool.
-    cp = run(f"{guid_tool} -h")
-
-    if cp.returncode:
+    if cps['guid-tool'].returncode:
         logging.error(f"{red}guid-tool not found{normal}")
         sys.exit(1)
 
     # Check that we have capsule-tool.
-    cp = run(f"{capsule_tool} -h")
-
-    if cp.returncode:
+    if cps['capsule-tool'].returncode:
         logging.error(f"{red}capsule-tool not found{normal}")
         sys.exit(1)
 
     # Check that we have dtc.
-    cp = run(f"{dtc} --version")
+    cp = cps['dtc']
 
     if cp.returncode:
         logging.error(f"{red}dtc not found{normal}")
         sys.exit(1)
 
-    dtc_ver = cp.stdout.decode().rstrip()
-    dtc_ver = re.sub(r'Version: ', '', dtc_ver)
+    dtc_ver = cp.stdout.rstrip()
+    dtc_ver = dtc_ver.removeprefix('Version: ')
     meta_data['dtc-version'] = dtc_ver
 
     # Check that we have dt-validate.
+    # This can install it, so we do not run it in parallel.
     check_dt_validate()
 
     # Check that we have dt-parser.
-    cp = run(f"{dt_parser} -h")
-
-    if cp.returncode:
+    if cps['dt-parser'].returncode:
         logging.error(f"{red}dt-parser not found{normal}")
         sys.exit(1)
 
     # Check that we have compatibles.
-    cp = run(f"{compatibles} -h")
-
-    if cp.returncode:
+    if cps['compatibles'].returncode:
         logging.error(f"{red}compatibles not found{normal}")
         sys.exit(1)
 
@@ -1563,33 +1693,49 @@ def overlay_file(src: FileType, dst: FileType) -> None:
 
 
 # Overlay the src dir over the dst dir, in-place.
-def overlay_dir(src: DirType, dst: DirType) -> None:
+def overlay_dir(src: DirType, dst: DirType, luts: TreeLutsType) -> None:
     logging.debug(f"Overlay dir {src['dir']}")
 
     for k, v in src.items():
         # We have a special case when "merging" tree.
         if k == 'tree' and 'tree' in dst:
-            overlay_tree(src['tree'], dst['tree'])
+            overlay_tree(src['tree'], dst['tree'], luts)
             continue
 
         overlay_property(cast(dict[str, Any], dst), k, v)
 
 
-# Overlay the src tree over the dst tree, in-place.
-def overlay_tree(src: TreeType, dst: TreeType) -> None:
-    # Prepare two LUTs.
-    files = {}
-    dirs = {}
+# Get the files and dirs LUTs of a tree.
+# We build them on first use only, and keep them in luts.
+def tree_luts(
+        tree: TreeType, luts: TreeLutsType
+        ) -> tuple[dict[str, FileType], dict[str, DirType]]:
 
-    for x in dst:
-        if 'file' in x:
-            f = cast(FileType, x)
-            files[f['file']] = f
-        elif 'dir' in x:
-            d = cast(DirType, x)
-            dirs[d['dir']] = d
-        else:
-            raise Exception(f"Bad x not file or dir {x}")
+    if id(tree) not in luts:
+        files = {}
+        dirs = {}
+
+        for x in tree:
+            if 'file' in x:
+                f = cast(FileType, x)
+                files[f['file']] = f
+            elif 'dir' in x:
+                d = cast(DirType, x)
+                dirs[d['dir']] = d
+            else:
+                raise Exception(f"Bad x not file or dir {x}")
+
+        luts[id(tree)] = (tree, files, dirs)
+
+    _, files, dirs = luts[id(tree)]
+    return files, dirs
+
+
+# Overlay the src tree over the dst tree, in-place.
+# The LUTs are kept up to date when we add entries to dst, so that they can be
+# re-used for the next overlays.
+def overlay_tree(src: TreeType, dst: TreeType, luts: TreeLutsType) -> None:
+    files, dirs = tree_luts(dst, luts)
 
     # Overlay each entry.
     for x in src:
@@ -1600,13 +1746,15 @@ def overlay_tree(src: TreeType, dst: TreeType) -> None:
             else:
                 logging.debug(f"Adding file {f['file']}")
                 dst.append(f)
+                files[f['file']] = f
         elif 'dir' in x:
             d = cast(DirType, x)
             if d['dir'] in dirs:
-                overlay_dir(d, dirs[d['dir']])
+                overlay_dir(d, dirs[d['dir']], luts)
             else:
                 logging.debug(f"Adding dir {d['dir']}")
                 dst.append(d)
+                dirs[d['dir']] = d
         else:
             raise Exception(f"Bad x not file or dir {x}")
 
@@ -1617,31 +1765,28 @@ def evaluate_when_condition(
         ) -> bool:
 
     logging.debug(f"Evaluate {conditions}, any_not_all: {any_not_all}")
-    found_all = True
-    found_some = False
-
-    for c in conditions:
-        for d in context:
-            if c in d:
-                logging.debug(f"`{c}' found in `{d}'")
-                found_some = True
-                break
-        else:
-            logging.debug(f"Did not find `{c}'")
-            found_all = False
 
-    return bool(not any_not_all and found_all or any_not_all and found_some)
+    # We look for each condition in the whole context at once, joined with a
+    # character which cannot appear in file names.
+    # Note that the empty condition matches any non-empty context.
+    ctx = '\0'.join(context)
+    found = [bool(context) and c in ctx for c in conditions]
+    logging.debug(f"Found {found}")
+
+    return any(found) if any_not_all else all(found)
 
 
 # Apply all the overlays conditionally to the main tree.
 def apply_overlays(conf: ConfigType, context: ContextType) -> None:
+    luts: TreeLutsType = {}
+
     for i, o in enumerate(conf['overlays']):
         if ('when-any' in o
            and evaluate_when_condition(o['when-any'], context, True)
            or 'when-all' in o
            and evaluate_when_condition(o['when-all'], context, False)):
             logging.debug(f"Applying overlay {i}")
-            overlay_tree(o['tree'], conf['tree'])
+            overlay_tree(o['tree'], conf['tree'], luts)
 
 
 # While at it, put our meta-data there as comments.
@@ -1667,13 +1812,15 @@ def print_not_checked() -> None:
 # Get git commit.
 # Return None in case of error.
 def git_commit(dirname: str) -> Optional[str]:
-    cp = run(f"git -C '{dirname}' describe --always --abbrev=12 --dirty")
+    cp = run(
+        ['git', '-C', dirname, 'describe', '--always', '--abbrev=12',
+         '--dirty'])
 
     if cp.returncode:
         logging.debug(f"No git or {dirname} not versioned")
         return None
 
-    return cp.stdout.decode().rstrip()
+    return cp.stdout.rstrip()
 
 
 # Capture initial meta-data.
@@ -1702,70 +1849,70 @@ def print_meta(f: IO[str] = sys.stdout, pre: str = '') -> None:
 if __name__ == '__main__':
     me = os.path.realpath(__file__)
     here = os.path.dirname(me)
-    parser = argparse.ArgumentParser(
+    argparser = argparse.ArgumentParser(
         description='Perform a number of verifications on a SystemReady'
                     ' results tree.',
         epilog='We expect the tree to be layout as described in the '
                'SystemReady IR template '
                '(https://gitlab.arm.com/systemready/systemready-ir-template).',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument(
+    argparser.add_argument(
         '--all', action='store_true',
         help='Output all warnings, even the "once" ones.')
-    parser.add_argument(
+    argparser.add_argument(
         '--cache-dir', help='Specify cache directory',
         default=f"{os.path.expanduser('~')}/.check-sr-results")
-    parser.add_argument(
+    argparser.add_argument(
         '--capsule-tool', help='Specify capsule-tool.py path',
         default=f'{here}/capsule-tool.py')
-    parser.add_argument(
+    argparser.add_argument(
         '--cleanup-line-limit', type=int, default=99,
         help='Specify maximum number of iterations for line cleanup')
-    parser.add_argument(
+    argparser.add_argument(
         '--compatibles', help='Specify compatibles path',
         default=f"{here}/compatibles")
-    parser.add_argument('--config', help='Specify YAML configuration file')
-    parser.add_argument(
+    argparser.add_argument('--config', help='Specify YAML configuration file')
+    argparser.add_argument(
         '--debug', action='store_true', help='Turn on debug messages')
-    parser.add_argument(
+    argparser.add_argument(
         '--dir', help='Specify directory to check', default='.')
-    parser.add_argument(
+    argparser.add_argument(
         '--detect-file-encoding-limit', type=int, default=999,
         help='Specify file encoding detection limit, in number of lines')
-    parser.add_argument('--dtc', help='Specify dtc path', default='dtc')
-    parser.add_argument(
+    argparser.add_argument('--dtc', help='Specify dtc path', default='dtc')
+    argparser.add_argument(
         '--dt-parser', help='Specify dt-parser.py path',
         default=f'{here}/dt-parser.py')
-    parser.add_argument(
+    argparser.add_argument(
         '--dt-validate', help='Specify dt-validate path',
         default='dt-validate')
-    parser.add_argument(
+    argparser.add_argument(
         '--ethernet-parser',
         help='Specify ethernet-parser.py path and arguments',
         default=f'{here}/ethernet-parser.py')
-    parser.add_argument(
+    argparser.add_argument(
         '--ethernet-devices', type=int,
         help='Force how many ethernet devices should be checked')
-    parser.add_argument('--dump-config', help='Output yaml config filename')
-    parser.add_argument(
+    argparser.add_argument('--dump-config', help='Output yaml config filename')
+    argparser.add_argument(
         '--force-regen', action='store_true',
         help='Force re-generating all we can')
-    parser.add_argument(
+    argparser.add_argument(
         '--guid-tool', help='Specify guid-tool.py path',
         default=f'{here}/guid-tool.py')
-    parser.add_argument(
+    argparser.add_argument(
         '--identify', help='Specify identify.py path',
         default=f'{here}/identify.py')
-    parser.add_argument(
+    argparser.add_argument(
         '--linux-url', help='Specify Linux tarball URL',
         default='https://cdn.kernel.org/pub/linux/kernel/v6.x/'
                 'linux-6.12.1.tar.xz')
-    parser.add_argument(
+    argparser.add_argument(
         '--parser', help='Specify (SCT) parser.py path',
         default='parser.py')
-    parser.add_argument(
+    argparser.add_argument(
         '--print-meta', action='store_true', help='Print meta-data to stdout')
-    args = parser.parse_args()
+    args = argparser.parse_args()
 
     logging.basicConfig(
         format='%(levelname)s %(funcName)s: %(message)s',
@@ -1778,13 +1925,18 @@ if __name__ == '__main__':
 
     logreader.detect_file_encoding_limit = args.detect_file_encoding_limit
     logreader.cleanup_line_limit = args.cleanup_line_limit
-    guid_tool = args.guid_tool + (' --debug' if args.debug else '')
-    capsule_tool = args.capsule_tool + (' --debug' if args.debug else '')
+
+    # Prepare the commands of our tools once, as lists of arguments.
+    # The tools options can contain arguments, which we split like the shell.
+    debug = ['--debug'] if args.debug else []
+    guid_tool = [*shlex.split(args.guid_tool), *debug]
+    capsule_tool = [*shlex.split(args.capsule_tool), *debug]
     dtc = args.dtc
-    dt_parser = args.dt_parser + (' --debug' if args.debug else '')
-    parser = args.parser + (' --debug' if args.debug else '')
+    dt_parser = [*shlex.split(args.dt_parser), *debug]
+    parser = [*shlex.split(args.parser), *debug]
     dt_validate = args.dt_validate
-    ethernet_parser = args.ethernet_parser + (' --debug' if args.debug else '')
+    ethernet_parser = [*shlex.split(args.ethernet_parser), *debug]
+    identify = [*shlex.split(args.identify), *debug]
     num_eth_devices = args.ethernet_devices
     compatibles = args.compatibles
     linux_url = args.linux_url
@@ -1797,11 +1949,7 @@ if __name__ == '__main__':
 
     check_prerequisites()
 
-    me = os.path.realpath(__file__)
-    here = os.path.dirname(me)
-
     # Identify SystemReady version.
-    identify = args.identify + (' --debug' if args.debug else '')
     files, ver = run_identify(args.dir, identify)
 
     # Choose config.
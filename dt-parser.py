@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 
 import argparse
+import collections
 import logging
 import os
 import re
 import pprint
 import json
 import sys
-from typing import Any, Optional, cast, TypedDict
+from typing import Any, Final, Optional, cast, TypedDict
 import yaml
 
 
@@ -32,13 +33,46 @@ class EntryType(TypedDict, total=False):
 
 ConfigType = list[ConfigEntry]
 
+# Logs can be large; read them with a bigger buffer to reduce system calls.
+READ_BUFFER_SIZE: Final = 1 << 20
+
+# Regular expressions used while parsing logs.
+# We compile them once here rather than for each line.
+TABS_RE: Final = re.compile(r'\t+')
+ADDRESS_RE: Final = re.compile(r'@[0-9A-Fa-f]+')
+NO_SCHEMA_RE: Final = re.compile(
+    r'failed to match any schema with compatible: \[(.*)\]')
+QUOTED_RE: Final = re.compile(r"'([^']*)'")
+
+# Multi-lines dt-validate warning continuations, with one named group per
+# kind of line.
+CONT_RE: Final = re.compile(
+    r'(?P<schema>\t(?i:from schema):? (?P<schema_path>.*))'
+    r'|(?P<cont>\t.*)')
+
+# All the other kinds of lines we know, with one named group per kind of line.
+# The alternatives are tried in order, like individual matches would be.
+LINE_RE: Final = re.compile(
+    r'(?P<shell>\+ .*)'
+    r'|(?P<dtc_warn>(?P<dtc_file>[^:]+):(?:[\d\.]+-[\d\.]+:)? '
+    r'Warning \((?P<dtc_name>[^\)]+)\): (?P<dtc_node>.+): (?P<dtc_msg>.*))'
+    r'|(?P<match_fail>(?P<mf_file>[^:]+)(?::\d+:\d+)?: (?P<mf_node>[^:]+): '
+    r'(?P<mf_msg>failed to match any schema.*))'
+    r'|(?P<schema_err>(?P<se_file>[^:]+): ignoring, error in schema: *'
+    r'(?P<se_msg>.*))'
+    r'|(?P<dtv_start>(?P<ds_file>/[^:]+): (?P<ds_node>[^:]+): (?P<ds_msg>.*))')
+
+# Entries keys, on which we index the configuration rules.
+# Most rules have criteria on those keys.
+RULES_INDEX_KEYS: Final = ('type', 'dtc_warning_name')
+
 
 # Load YAML configuration file
 def load_config(filename: str) -> ConfigType:
     logging.debug(f"Load `{filename}'")
 
-    with open(filename, 'r') as yamlfile:
-        y = yaml.load(yamlfile, Loader=yaml.FullLoader)
+    with open(filename, 'rb') as yamlfile:
+        y = yaml.load(yamlfile, Loader=yaml.CSafeLoader)
         conf = cast(Optional[ConfigType], y)
 
     if conf is None:
@@ -47,16 +81,18 @@ def load_config(filename: str) -> ConfigType:
     logging.debug(f"{len(conf)} rules")
 
     # Verify that rules names are unique.
-    s = set()
+    # We look for the first duplicate only when there is one.
+    names = [r['rule'] for r in conf]
 
-    for r in conf:
-        rule = r['rule']
+    if len(set(names)) != len(names):
+        s = set()
 
-        if rule in s:
-            logging.error(f"Duplicate rule `{rule}'!")
-            sys.exit(1)
+        for rule in names:
+            if rule in s:
+                logging.error(f"Duplicate rule `{rule}'!")
+                sys.exit(1)
 
-        s.add(rule)
+            s.add(rule)
 
     return conf
 
@@ -78,7 +114,7 @@ def load_compatibles(filename: str) -> set[str]:
 # Cleanup line a bit before adding it to the warning message.
 # We remove \t for now.
 def clean_line(line: str) -> str:
-    return re.sub(r'\t+', ' ', line)
+    return TABS_RE.sub(' ', line)
 
 
 # Parse Devicetree related tools logs.
@@ -87,6 +123,10 @@ def parse(filename: str) -> list[EntryType]:
     r = []
     dt_val: Optional[EntryType] = None
 
+    # We print debug messages for each line, so we avoid formatting them at all
+    # when we do not need them.
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
     def flush_dt_val() -> None:
         nonlocal dt_val, r
 
@@ -97,34 +137,36 @@ def parse(filename: str) -> list[EntryType]:
         r.append(dt_val)
         dt_val = None
 
-    with open(filename) as f:
+    with open(filename, buffering=READ_BUFFER_SIZE) as f:
         for i, line in enumerate(f):
             line = line.rstrip()
 
             # multi-lines dt-validate warning continuations
             # This must be tried first
             if dt_val is not None:
+                m = CONT_RE.match(line)
+                kind = m.lastgroup if m else None
+
                 #        From schema: /home/vinste01/...
                 #    from schema $id: http://devicetree.org/...
-                m = re.match(r'\tfrom schema:? (.*)', line, flags=re.I)
-
-                if m:
-                    logging.debug(
-                        f"line {i}: multi-lines dt-validate schema "
-                        f"continuation (`{line}')")
+                if kind == 'schema':
+                    assert m is not None
+                    if debug:
+                        logging.debug(
+                            f"line {i}: multi-lines dt-validate schema "
+                            f"continuation (`{line}')")
 
                     dt_val['dt_validate_lines'].append(line)
                     assert 'dt_validate_schema' not in dt_val
-                    dt_val['dt_validate_schema'] = m[1]
+                    dt_val['dt_validate_schema'] = m['schema_path']
                     continue
 
                 #        'arm,armv8-timer' is not one of [...
-                m = re.match(r'\t(.*)', line)
-
-                if m:
-                    logging.debug(
-                        f"line {i}: multi-lines dt-validate continuation "
-                        f"(`{line}')")
+                if kind == 'cont':
+                    if debug:
+                        logging.debug(
+                            f"line {i}: multi-lines dt-validate continuation "
+                            f"(`{line}')")
 
                     dt_val['dt_validate_lines'].append(line)
                     dt_val['warning_message'] += clean_line(line)
@@ -135,12 +177,21 @@ def parse(filename: str) -> list[EntryType]:
                 # continuing to parse.
                 flush_dt_val()
 
+            # Probe all the other kinds of lines at once.
+            # Shell traces are frequent and easy to recognize, so we do not
+            # need a regex for them.
+            if line.startswith('+ '):
+                m = None
+                kind = 'shell'
+            else:
+                m = LINE_RE.match(line)
+                kind = m.lastgroup if m else None
+
             # Ignore shell traces for convenience
             # + ./dt-schema/tools/dt-validate -s linux/...
-            m = re.match(r'\+ .*', line)
-
-            if m:
-                logging.debug(f"line {i}: shell trace (`{line}')")
+            if kind == 'shell':
+                if debug:
+                    logging.debug(f"line {i}: shell trace (`{line}')")
                 continue
 
             # dtc warning
@@ -149,21 +200,18 @@ def parse(filename: str) -> list[EntryType]:
             # dump.dts: Warning (avoid_unnecessary_addr_size): /gpio-keys:
             # unnecessary #address-cells/#size-cells without "ranges" or child
             # "reg" property
-            m = re.match(
-                r'([^:]+):(?:[\d\.]+-[\d\.]+:)? Warning \(([^\)]+)\): '
-                r'(.+): (.*)',
-                line)
-
-            if m:
-                logging.debug(f"line {i}: dtc warning (`{line}')")
+            if kind == 'dtc_warn':
+                assert m is not None
+                if debug:
+                    logging.debug(f"line {i}: dtc warning (`{line}')")
                 r.append({
-                    'devicetree_node': m[3],
-                    'dtc_warning_name': m[2],
-                    'file': m[1],   # Output file
+                    'devicetree_node': m['dtc_node'],
+                    'dtc_warning_name': m['dtc_name'],
+                    'file': m['dtc_file'],  # Output file
                     'line': line,
                     'linenum': i + 1,
                     'type': 'dtc warning',
-                    'warning_message': m[4]
+                    'warning_message': m['dtc_msg']
                 })
                 continue
 
@@ -171,62 +219,60 @@ def parse(filename: str) -> list[EntryType]:
             # qemu.dtb:0:0: /platform@c000000: failed to match any schema with
             # compatible: ['qemu,platform', 'simple-bus']
             # also only beginning with qemu.dtb: (without 0:0:)
-            m = re.match(
-                r'([^:]+)(?::\d+:\d+)?: ([^:]+): '
-                r'(failed to match any schema.*)',
-                line)
-
-            if m:
-                logging.debug(
-                    f"line {i}: dt-validate match failure warning (`{line}')")
+            if kind == 'match_fail':
+                assert m is not None
+                if debug:
+                    logging.debug(
+                        f"line {i}: dt-validate match failure warning "
+                        f"(`{line}')")
 
                 r.append({
-                    'devicetree_node': m[2],
-                    'file': m[1],   # Input file
+                    'devicetree_node': m['mf_node'],
+                    'file': m['mf_file'],   # Input file
                     'line': line,
                     'linenum': i + 1,
                     'type': 'dt-validate warning',
-                    'warning_message': m[3]
+                    'warning_message': m['mf_msg']
                 })
                 continue
 
             # single-line dt-validate error in schema warning
             # /xxx/bindings/yyy/zzz,www.yaml: ignoring, error in schema:
             # maintainers: 0
-            m = re.match(r'([^:]+): ignoring, error in schema: *(.*)', line)
-
-            if m:
-                logging.debug(
-                    f"line {i}: dt-validate error in schema warning "
-                    f"(`{line}')")
+            if kind == 'schema_err':
+                assert m is not None
+                if debug:
+                    logging.debug(
+                        f"line {i}: dt-validate error in schema warning "
+                        f"(`{line}')")
 
                 r.append({
                     'devicetree_node': '',  # TODO! optional
-                    'file': m[1],   # Input file
+                    'file': m['se_file'],   # Input file
                     'line': line,
                     'linenum': i + 1,
                     'type': 'dt-validate error in schema',
-                    'warning_message': m[2]
+                    'warning_message': m['se_msg']
                 })
                 continue
 
             # multi-lines dt-validate warning start
             # /home/vinste01/systemreadyir/dt/dump.dtb: pl061@9030000:
             # $nodename:0: 'pl061@9030000' does not match ...
-            m = re.match(r'(/[^:]+): ([^:]+): (.*)', line)
-
-            if m:
-                logging.debug(
-                    f"line {i}: multi-lines dt-validate warning start "
-                    f"(`{line}')")
+            if kind == 'dtv_start':
+                assert m is not None
+                if debug:
+                    logging.debug(
+                        f"line {i}: multi-lines dt-validate warning start "
+                        f"(`{line}')")
 
                 dt_val = {
-                    'devicetree_node': m[2],
+                    'devicetree_node': m['ds_node'],
                     'dt_validate_lines': [line],
-                    'file': m[1],       # Input file
-                    'linenum': i + 1,   # First line
+                    'file': m['ds_file'],   # Input file
+                    'linenum': i + 1,       # First line
                     'type': 'dt-validate warning',
-                    'warning_message': m[3]
+                    'warning_message': m['ds_msg']
                 }
                 continue
 
@@ -241,121 +287,123 @@ def parse(filename: str) -> list[EntryType]:
     return r
 
 
-# Cleanup entries
+# Cleanup an entry
 # We remove all mmio addresses: name@12345678 -> name@x
-# We modify parsed in-place
-def cleanup_entries(parsed: list[EntryType]) -> None:
-    logging.debug('Cleanup')
+# We modify the entry in-place and return the number of fields cleaned up.
+def cleanup_entry(i: int, x: EntryType) -> int:
     n = 0
+    y = cast(dict[str, Any], x)
 
-    for i, x in enumerate(parsed):
-        m = n
-        y = cast(dict[str, Any], x)
+    for k, b in y.items():
+        # Consider strings only
+        # Most fields have no address; do not bother with the regex then
+        if not isinstance(b, str) or '@' not in b:
+            continue
 
-        for k in y.keys():
-            b = y[k]
+        a = ADDRESS_RE.sub('@x', b)
 
-            # Consider strings only
-            if not isinstance(b, str):
-                continue
+        if a != b:
+            y[k] = a
+            n += 1
 
-            a = re.sub(r'@[0-9A-Fa-f]+', '@x', y[k])
+    if n:
+        logging.debug(
+            f"Cleaned up {n} field(s) of entry {i}, "
+            f"`{y['devicetree_node']}'")
 
-            if a != b:
-                y[k] = a
-                n += 1
+    return n
 
-        if n > m:
-            logging.debug(
-                f"Cleaned up {n - m} field(s) of entry {i}, "
-                f"`{y['devicetree_node']}'")
 
-    if n:
-        logging.debug(f"Cleaned up {n} entries")
+# Add compatibles informations to a 'no schema' entry, for which we have the
+# compatible in a set.
+# For a 'no schema' dt-validate warning we create an `in_compatibles' key with
+# the list of all the compatibles present in the set as a string, or '<none>'.
+# We modify the entry in-place and return True when we found compatibles.
+def add_compatibles(i: int, x: EntryType, compatibles: set[str]) -> bool:
+    if x['type'] != 'dt-validate warning':
+        return False
 
+    m = NO_SCHEMA_RE.match(x['warning_message'])
 
-# Compare entries for de-duplication
-# We do not compare non-string keys, such as linenum or dt_validate_lines as
-# they do not get cleaned-up anyway
-# We return True if entries should be de-duplicated
-def dupes(a: EntryType, b: EntryType) -> bool:
-    x = cast(dict[str, Any], a)
-    y = cast(dict[str, Any], b)
+    if not m:
+        return False
 
-    for k in x.keys():
-        if not isinstance(x[k], str):
-            continue
+    t = [c for c in QUOTED_RE.findall(m[1]) if c in compatibles]
 
-        if x[k] != y[k]:
-            return False
+    for c in t:
+        logging.debug(f"entry {i} 'no schema', {c} in compatibles")
 
-    return True
+    if len(t) > 0:
+        x['in_compatibles'] = ', '.join(t)
+        return True
+
+    x['in_compatibles'] = '<none>'
+    return False
 
 
-# De-duplicate entries
-def dedupe_entries(parsed: list[EntryType]) -> list[EntryType]:
-    logging.debug('De-dupe')
+# Normalize entries, in a single pass
+# We add compatibles informations to all entries and, when de-duplicating, we
+# cleanup entries and remove duplicates.
+# An entry is a duplicate when all its string fields are equal to the same
+# fields of a previous entry.
+# We do not compare non-string keys, such as linenum or dt_validate_lines as
+# they do not get cleaned-up anyway
+# Rather than comparing each entry with all the previous ones, we index the
+# entries we keep by the values of their fields, for each set of string keys
+# found in the entries so far.
+# We run before rules, we modify the entries in-place.
+def normalize_entries(
+        parsed: list[EntryType], compatibles: set[str],
+        dedupe: bool) -> list[EntryType]:
+
+    logging.debug('Normalize')
     r: list[EntryType] = []
-    n = 0
+    nc = 0
+    nf = 0
+    nd = 0
+    seen: dict[tuple[str, ...], set[tuple[str, ...]]] = {}
 
     for i, x in enumerate(parsed):
-        d = False
+        if add_compatibles(i, x, compatibles):
+            nc += 1
 
-        # TODO! Better way than comparing each entry.
-        for y in r:
-            if dupes(x, y):
-                d = True
-                break
-
-        if d:
-            logging.debug(f"De-duplicated entry {i}, `{x['devicetree_node']}'")
-            n += 1
+        if not dedupe:
+            r.append(x)
             continue
 
-        r.append(x)
-
-    logging.info(f"De-duplicated {n} entries")
-    return r
-
+        nf += cleanup_entry(i, x)
+        y = cast(dict[str, Any], x)
+        ks = tuple(sorted(k for k, v in y.items() if isinstance(v, str)))
 
-# Add compatibles informations to the 'no schema' entries, for which we have
-# the compatible in a set.
-# For all the 'no schema' dt-validate warnings we create an `in_compatibles'
-# key with the list of all the compatibles present in the set as a string,
-# or '<none>'.
-# We run before rules, we modify parsed in-place.
-def add_compatibles(parsed: list[EntryType], compatibles: set[str]) -> None:
-    logging.debug('Add compatibles')
-    n = 0
+        # First entry with this set of keys; index the entries kept so far.
+        if ks not in seen:
+            kept = cast(list[dict[str, Any]], r)
+            seen[ks] = {
+                tuple(z[k] for k in ks) for z in kept
+                if all(isinstance(z.get(k), str) for k in ks)}
 
-    for i, x in enumerate(parsed):
-        if x['type'] != 'dt-validate warning':
+        if tuple(y[k] for k in ks) in seen[ks]:
+            logging.debug(f"De-duplicated entry {i}, `{x['devicetree_node']}'")
+            nd += 1
             continue
 
-        m = re.match(
-            r'failed to match any schema with compatible: \[(.*)\]',
-            x['warning_message'])
+        r.append(x)
 
-        if not m:
-            continue
+        # Index this entry for all the sets of keys it has.
+        for k2, s in seen.items():
+            if all(isinstance(y.get(k), str) for k in k2):
+                s.add(tuple(y[k] for k in k2))
 
-        t = []
+    if nc:
+        logging.info(f"Added {nc} compatibles")
 
-        for y in re.finditer(r"'([^']*)'", m[1]):
-            c = y[1]
+    if nf:
+        logging.debug(f"Cleaned up {nf} field(s)")
 
-            if c in compatibles:
-                logging.debug(f"entry {i} 'no schema', {c} in compatibles")
-                t.append(c)
+    if dedupe:
+        logging.info(f"De-duplicated {nd} entries")
 
-        if len(t) > 0:
-            x['in_compatibles'] = ', '.join(t)
-            n += 1
-        else:
-            x['in_compatibles'] = '<none>'
-
-    if n:
-        logging.info(f"Added {n} compatibles")
+    return r
 
 
 # Evaluate if an entry matches a criteria
@@ -370,23 +418,56 @@ def matches_crit(entry: EntryType, crit: dict[str, str]) -> bool:
     e = cast(dict[str, str], entry)
 
     for key, value in crit.items():
-        if key not in entry or e[key].find(value) < 0:
+        if key not in e or value not in e[key]:
             return False
 
     return True
 
 
+# Select the configuration rules, which can apply to entries with the given
+# values for the RULES_INDEX_KEYS (None when the entries do not have the key)
+# We return the rules in order, with their index and their criteria other than
+# the ones on RULES_INDEX_KEYS, which we have already evaluated
+def select_rules(
+        conf: ConfigType, values: tuple[Optional[str], ...]
+        ) -> list[tuple[int, ConfigEntry, dict[str, str]]]:
+
+    r = []
+
+    for j, c in enumerate(conf):
+        crit = dict(c['criteria'])
+
+        for k, v in zip(RULES_INDEX_KEYS, values):
+            cv = crit.pop(k, None)
+
+            if cv is not None and (v is None or cv not in v):
+                break
+        else:
+            r.append((j, c, crit))
+
+    return r
+
+
 # Apply all configuration rules to the entries
 # We modify parsed in-place
+# We select the rules, which can apply to entries with the same values for the
+# RULES_INDEX_KEYS only once.
 def apply_rules(parsed: list[EntryType], conf: ConfigType) -> None:
     logging.debug('Apply rules')
     n = 0
+    rules_index: dict[
+        tuple[Optional[str], ...],
+        list[tuple[int, ConfigEntry, dict[str, str]]]] = {}
 
     for i, x in enumerate(parsed):
         y = cast(dict[str, str], x)
+        values = tuple(y.get(k) for k in RULES_INDEX_KEYS)
+
+        if values not in rules_index:
+            rules_index[values] = select_rules(conf, values)
 
-        for j, r in enumerate(conf):
-            if not matches_crit(x, r['criteria']):
+        for j, r, crit in rules_index[values]:
+            if not matches_crit(x, crit):
                 continue
 
             rule = r['rule']
@@ -414,13 +495,13 @@ def filter_entries(parsed: list[EntryType], Filter: str) -> list[EntryType]:
     logging.debug(f"Filtering with `{Filter}'")
     before = len(parsed)
 
-    # This function "wraps" the filter and is called for each test
+    # We compile the filter expression only once.
     # `x' is referred to from the filter expression.
-    def function(x: EntryType) -> bool:
-        # pylint: disable=unused-argument eval-used
-        return bool(eval(Filter))
+    code = compile(Filter, '<filter>', 'eval')
+    g = globals()
 
-    r = list(filter(function, parsed))
+    # pylint: disable=eval-used
+    r = [x for x in parsed if eval(code, g, {'x': x})]
     after = len(r)
     n = before - after
     logging.info(f"Filtered out {n} entries, kept {after}")
@@ -432,66 +513,49 @@ def filter_entries(parsed: list[EntryType], Filter: str) -> list[EntryType]:
 def print_table(t: list[Any], title: str) -> None:
     n = len(t[0]) if len(t) else 0
 
-    # First pass to compute n-1 column sizes.
-    s = [0 for i in range(n - 1)]
+    # Compute n-1 column sizes.
+    s = [max(map(len, map(str, c))) for c in list(zip(*t))[:n - 1]]
 
-    for x in t:
-        for i in range(n - 1):
-            s[i] = max(s[i], len(str(x[i])))
-
-    # Second pass to print.
     print(title)
     print('-' * len(title))
 
-    for x in t:
-        p = f'{x[0]:>{s[0]}}'
+    if not t:
+        return
 
-        for i in range(1, n - 1):
-            p += f'  {x[i]:<{s[i]}}'
+    # Prepare the line format once and print.
+    fmt = '  '.join(
+        [f'{{:>{s[0]}}}', *(f'{{:<{w}}}' for w in s[1:]), '{}'])
 
-        print(f'{p}  {x[n - 1]}')
+    for x in t:
+        print(fmt.format(*x))
 
 
 # Compute and print statistics as summary
 def print_summary(parsed: list[EntryType]) -> None:
     logging.debug('Summary')
-    h = {}
-
-    for x in parsed:
-        typ = x['type']
-
-        if typ not in h:
-            h[typ] = 0
-
-        h[typ] += 1
-
-    t = []
-
-    for k in sorted(h.keys()):
-        t.append((h[k], k))
+    h = collections.Counter(x['type'] for x in parsed)
+    t = [(h[k], k) for k in sorted(h.keys())]
 
     print('')
     print_table(t, 'Summary')
 
 
+# Limit message width
+# We only copy the message when we need to truncate it
+def limit_width(w: str, max_len: int) -> str:
+    return w if len(w) <= max_len else f"{w[:max_len - 3]}..."
+
+
 # Print non-ignored entries
 def print_non_ignored(
         parsed: list[EntryType], max_message_len: int = 128) -> None:
 
     logging.debug('Print')
-    t = []
 
-    for x in parsed:
-        if x['type'] == 'ignored':
-            continue
-
-        w = x['warning_message']
-
-        # Limit message width.
-        if len(w) > max_message_len:
-            w = f"{w[:max_message_len - 3]}..."
-
-        t.append((x['devicetree_node'], x['type'], w))
+    t = [
+        (x['devicetree_node'], x['type'],
+         limit_width(x['warning_message'], max_message_len))
+        for x in parsed if x['type'] != 'ignored']
 
     print()
     print_table(t, 'Non-ignored entries')
@@ -513,8 +577,10 @@ def save_json(parsed: list[EntryType], filename: str) -> None:
 def save_yaml(parsed: list[EntryType], filename: str) -> None:
     logging.debug(f"Save `{filename}'")
 
-    with open(filename, 'w') as yamlfile:
-        yaml.dump(parsed, yamlfile, Dumper=yaml.CDumper)
+    # Let libyaml encode the output itself.
+    with open(filename, 'wb') as yamlfile:
+        yaml.dump(
+            parsed, yamlfile, Dumper=yaml.CSafeDumper, encoding='utf-8')
 
 
 if __name__ == '__main__':
@@ -564,11 +630,7 @@ if __name__ == '__main__':
 
     # Modify.
 
-    add_compatibles(p, compatibles)
-
-    if not args.no_dedupe:
-        cleanup_entries(p)
-        p = dedupe_entries(p)
+    p = normalize_entries(p, compatibles, not args.no_dedupe)
 
     apply_rules(p, conf)
 
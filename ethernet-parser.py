@@ -5,20 +5,38 @@ import re
 import logging
 import os
 import sys
-from typing import Any, Optional, cast
+from typing import Any, Final, Optional, cast
 import yaml
 
 DbType = dict[str, Any]
 ResType = list[list[dict[str, Any]]]
 
+# The patterns parse_eth_log() looks for in each line, as bytes.
+RUN_RE: Final = re.compile(rb'INFO: Running "ethtool ')
+ETHTOOL_RE: Final = re.compile(rb'The test result is (PASS|FAIL)')
+UNSUP_RE: Final = re.compile(rb" doesn't supports ethtool self test")
+NOLINK_RE: Final = re.compile(rb'INFO: Link not detected')
+PING_RE: Final = re.compile(rb'Ping to www.arm.com is (successful|.*)')
+
+# All the patterns as one alternation, from the beginning of a line, to find
+# the lines of interest with at most one match per line.
+LINE_RE: Final = re.compile(
+    rb'^[^\n]*?(?:' + b'|'.join(
+        x.pattern for x in (RUN_RE, ETHTOOL_RE, UNSUP_RE, NOLINK_RE, PING_RE))
+    + rb')',
+    re.MULTILINE)
+
+# Device qualities, which count as passing.
+PASS_QUALITIES: Final = ('POOR', 'BEST')
+
 
 # Load YAML ethernet_checks database
 def load_ethernet_db(filename: str) -> DbType:
     logging.debug(f"Load `{filename}'")
 
     if os.path.isfile(filename):
-        with open(filename, 'r') as yamlfile:
-            y = yaml.load(yamlfile, Loader=yaml.FullLoader)
+        with open(filename, 'rb') as yamlfile:
+            y = yaml.load(yamlfile, Loader=yaml.CSafeLoader)
             db = cast(Optional[DbType], y)
     else:
         logging.error(f'filename {filename} does not exist')
@@ -30,73 +48,94 @@ def load_ethernet_db(filename: str) -> DbType:
     return db
 
 
-def detect_eth_devices(log_path: str) -> int:
-    ethtool_pattern = re.compile(r'INFO: Running "ethtool ')
+# Parse the log in a single pass
+# We detect the ethernet devices and collect their results at the same time.
+# We return the results, with one list per device detected.
+def parse_eth_log(log_path: str) -> ResType:
+    device_results: ResType = []
     device_count = 0
-    with open(log_path, 'r') as log_file:
-        for line in log_file:
-            match_device = ethtool_pattern.search(line)
-            if match_device:
+    lookforping = False
+    # Results of the current device.
+    cur: list[dict[str, Any]] = []
+
+    # We scan the whole log at once and decode only the lines we match.
+    with open(log_path, 'rb') as log_file:
+        buf = log_file.read()
+
+    # The lines can contain several patterns: we check them in order, on the
+    # whole line.
+    for lm in LINE_RE.finditer(buf):
+        e = buf.find(b'\n', lm.start())
+        raw = buf[lm.start():e if e >= 0 else len(buf)]
+        line = raw.decode(errors='replace')
+
+        if RUN_RE.search(raw):
+            logging.debug(f"Got `{line.rstrip()}'")
+            device_results.append([])
+
+        if lookforping is False:
+            match_ethtool = ETHTOOL_RE.search(raw)
+            match_unsup = UNSUP_RE.search(raw)
+
+            # Ignore the results of a device, which we did not see running
+            # first (truncated log).
+            if ((match_ethtool or match_unsup)
+                    and device_count >= len(device_results)):
+                logging.error(
+                    f"No ethernet device for `{line.rstrip()}', ignoring")
+                continue
+
+            if match_ethtool:
                 logging.debug(f"Got `{line.rstrip()}'")
                 device_count += 1
-    logging.debug(f' ethernet devices detected: {device_count}')
-    return device_count
-
+                cur = device_results[device_count-1]
+                result = match_ethtool[1].decode()
+                cur.append({'ethtool': result})
+                if result == 'PASS':
+                    logging.debug(f" Ethtool: device {device_count},"
+                                  f" PASSED")
+                elif result == 'FAIL':
+                    logging.debug(f" Ethtool: device {device_count}, "
+                                  f" FAILED")
+                lookforping = True
+            elif match_unsup:
+                logging.debug(f"Got `{line.rstrip()}'")
+                device_count += 1
+                cur = device_results[device_count-1]
+                logging.debug(
+                    f" Ethtool: device {device_count}, "
+                    "selftest unsupported")
+                cur.append({'ethtool': 'FAIL'})
+                lookforping = True
+
+        if lookforping is True:
+            match_no_link = NOLINK_RE.search(raw)
+            match_ping = PING_RE.search(raw)
+
+            if match_no_link:
+                logging.debug(f"Got `{line.rstrip()}'")
+                logging.debug(f" Ping: device {device_count}, FAILED")
+                cur.append({'ping': 'FAIL'})
+                lookforping = False
+            elif match_ping:
+                logging.debug(f"Got `{line.rstrip()}'")
+                result = match_ping[1].decode(errors='replace')
+                lookforping = False
+                if result == 'successful':
+                    logging.debug(f" Ping: device {device_count}, PASSED")
+                    cur.append({'ping': 'PASS'})
+                elif result != 'successful':
+                    logging.debug(f" Ping: device {device_count}, FAILED")
+                    cur.append({'ping': 'FAIL'})
 
-def parse_eth_log(log_path: str, device_results: ResType) -> None:
-    ethtool_pattern = re.compile(r'The test result is (PASS|FAIL)')
-    unsup_pattern = re.compile(r" doesn't supports ethtool self test")
-    ping_pattern = re.compile(r'Ping to www.arm.com is (successful|.*)')
-    link_pattern = re.compile(r'INFO: Link not detected')
+    logging.debug(f' ethernet devices detected: {len(device_results)}')
+    return device_results
 
-    device_count = 0
-    lookforping = False
 
-    with open(log_path, 'r') as log_file:
-        for line in log_file:
-            if lookforping is False:
-                match_ethtool = ethtool_pattern.search(line)
-                match_unsup = unsup_pattern.search(line)
-                if match_ethtool:
-                    logging.debug(f"Got `{line.rstrip()}'")
-                    device_count += 1
-                    result = match_ethtool.group(1)
-                    device_results[device_count-1].append({'ethtool': result})
-                    if result == 'PASS':
-                        logging.debug(f" Ethtool: device {device_count},"
-                                      f" PASSED")
-                    elif result == 'FAIL':
-                        logging.debug(f" Ethtool: device {device_count}, "
-                                      f" FAILED")
-                    lookforping = True
-                elif match_unsup:
-                    logging.debug(f"Got `{line.rstrip()}'")
-                    device_count += 1
-                    logging.debug(
-                        f" Ethtool: device {device_count}, "
-                        "selftest unsupported")
-                    device_results[device_count-1].append(
-                        {'ethtool': 'FAIL'})
-                    lookforping = True
-
-            if lookforping is True:
-                match_no_link = link_pattern.search(line)
-                match_ping = ping_pattern.search(line)
-                if match_no_link:
-                    logging.debug(f"Got `{line.rstrip()}'")
-                    logging.debug(f" Ping: device {device_count}, FAILED")
-                    device_results[device_count-1].append({'ping': 'FAIL'})
-                    lookforping = False
-                elif match_ping:
-                    logging.debug(f"Got `{line.rstrip()}'")
-                    result = match_ping.group(1)
-                    lookforping = False
-                    if result == 'successful':
-                        logging.debug(f" Ping: device {device_count}, PASSED")
-                        device_results[device_count-1].append({'ping': 'PASS'})
-                    elif result != 'successful':
-                        logging.debug(f" Ping: device {device_count}, FAILED")
-                        device_results[device_count-1].append({'ping': 'FAIL'})
+# Hashable representation of a device results list, to index the criterias.
+# Two results lists are equal when their representations are equal.
+def results_key(results: list[dict[str, Any]]) -> tuple[Any, ...]:
+    return tuple(tuple(sorted(d.items())) for d in results)
 
 
 def apply_criteria(
@@ -105,34 +144,35 @@ def apply_criteria(
     logging.debug('apply criterias from the database')
     result = 'PASS'
     num_pass_devices = 0
+
+    # index the criterias by results
+    # the first one wins, as with a linear search
+    criterias: dict[tuple[Any, ...], dict[str, Any]] = {}
+
+    for ii in db['criterias']:
+        criterias.setdefault(results_key(ii['results']), ii)
+
     # look for the different combinations PASS/FAIL
     # and update the device register with the criteria
     # and recommendations from the database
     for dr in device_results:
-        found_match = False
-
-        for ii in db['criterias']:
-            if dr == ii['results']:
-                logging.debug(f"match found: {dr}")
-                dr.append({'result': ii['criteria']})
-                dr.append({'quality': ii['quality']})
-                dr.append({'recommendation': ii['recommendation']})
-                found_match = True
-                # don't care what other devices are. the end result is FAIL
-                if result == 'FAIL':
-                    result = 'FAIL'
-                # if new device result is BAD,
-                # the end result gets downgraded to overall
-                elif ii['quality'] == 'BAD':
-                    result = 'FAIL'
-                elif (result == 'PASS' and (ii['quality'] == 'POOR' or
-                                            ii['quality'] == 'BEST')):
-                    result = 'PASS'
-                    num_pass_devices += 1
-                break
-
-        if not found_match:
+        ii = criterias.get(results_key(dr))
+
+        if ii is None:
             logging.error(f"not validating match found for: {dr}")
+            continue
+
+        logging.debug(f"match found: {dr}")
+        dr.append({'result': ii['criteria']})
+        dr.append({'quality': ii['quality']})
+        dr.append({'recommendation': ii['recommendation']})
+        # if new device result is BAD,
+        # the end result gets downgraded to overall
+        # once the end result is FAIL, we don't care what other devices are
+        if ii['quality'] == 'BAD':
+            result = 'FAIL'
+        elif result == 'PASS' and ii['quality'] in PASS_QUALITIES:
+            num_pass_devices += 1
 
     if num_pass_devices == num_devices:
         logging.info(f"ethernet-parser passed for "
@@ -169,18 +209,16 @@ if __name__ == "__main__":
         level=logging.DEBUG if args.debug else logging.INFO)
 
     db = load_ethernet_db(args.config)
-    num_actual_devices = detect_eth_devices(args.log)
+    device_results = parse_eth_log(args.log)
+    num_actual_devices = len(device_results)
     num_expected_devices = args.num_devices
 
-    device_results: ResType = [[] for _ in
-                               range(num_actual_devices)]
     if num_expected_devices > num_actual_devices:
         logging.error(f'detected {num_actual_devices} '
                       f'and expected a bigger number of ethernets: '
                       f'{num_expected_devices}')
         result = 'FAIL'
     else:
-        parse_eth_log(args.log, device_results)
         result = apply_criteria(db, args.num_devices, device_results)
 
     logging.info(f'Ethernet parser tests result is: {result}')
@@ -1,34 +1,28 @@
 #!/usr/bin/env python3
 
 import argparse
+import collections
+import itertools
 import logging
 import sys
 import os
 import curses
 import pprint
-from typing import cast, TypedDict, Optional
+from typing import cast, Final, TypedDict, Optional
 import yaml
 import logreader
 
-try:
-    from packaging import version
-except ImportError:
-    print('No packaging. You should install python3-packaging...')
-
-# Not all yaml versions have a Loader argument.
-if 'packaging.version' in sys.modules and \
-   version.parse(yaml.__version__) >= version.parse('5.1'):
-    yaml_load_args = {'Loader': yaml.FullLoader}
-else:
-    yaml_load_args = {}
+# Output buffer size for the dump, which pprint writes in many small pieces.
+WRITE_BUFFER_SIZE: Final = 1 << 20
 
 # Colors
+# We skip the terminfo lookup when NO_COLOR is set (see https://no-color.org).
 normal = ''
 red = ''
 yellow = ''
 green = ''
 
-if os.isatty(sys.stdout.fileno()):
+if not os.environ.get('NO_COLOR') and os.isatty(sys.stdout.fileno()):
     try:
         curses.setupterm()
         setafb = curses.tigetstr('setaf') or bytes()
@@ -73,8 +67,8 @@ ConfigType = TypedDict('ConfigType', {
 def load_config(filename: str) -> ConfigType:
     logging.debug(f'Load {filename}')
 
-    with open(filename, 'r') as yamlfile:
-        y = yaml.load(yamlfile, **yaml_load_args)
+    with open(filename, 'rb') as yamlfile:
+        y = yaml.load(yamlfile, Loader=yaml.CSafeLoader)
         conf = cast(ConfigType, y)
 
     assert 'format-sr-results-configuration' in conf
@@ -102,20 +96,27 @@ def extract(x: ExtractType, dirname: str) -> ElementType:
 
     logging.debug(f"Extract from `{filename}'")
 
-    # First pass: find pattern.
+    # Find pattern and extract in a single pass.
+    # When extraction starts before the found line, we keep the lines we need
+    # in a small buffer.
+    lines = enumerate(logreader.LogReader(filename), start=1)
+    before: collections.deque[tuple[int, str]] = collections.deque(
+        maxlen=max(0, -int(x.get('first-line', 0))) + 1)
+    found = 0
+
     if 'find' in x:
-        found = 0
         pat = x['find']
 
-        for i, line in enumerate(logreader.LogReader(filename)):
-            ln = i + 1
-
-            if line.find(pat) >= 0:
+        for ln, line in lines:
+            if pat in line:
                 logging.debug(
                     f"{green}Found{normal} `{pat}' at line {ln}, `{line}'")
                 found = ln
+                before.append((ln, line))
                 break
 
+            before.append((ln, line))
+
         if not found:
             logging.error(
                 f"{red}Could not find{normal} `{pat}' in `{filename}'")
@@ -123,26 +124,30 @@ def extract(x: ExtractType, dirname: str) -> ElementType:
     else:
         found = 1
 
-    # Second pass: extract.
-    res = ''
+    res: list[str] = []
     ex = False
     first_line = found + int(x['first-line']) if 'first-line' in x else found
 
-    for i, line in enumerate(logreader.LogReader(filename)):
-        ln = i + 1
+    # Resolve the kind of 'last-line' once, rather than for each line.
+    ll = x.get('last-line')
+    last_num = found + ll if isinstance(ll, int) else None
+    last_pat = ll if isinstance(ll, str) else None
+    last_empty = 'last-line' in x and ll is None
 
-        if 'last-line' in x and ex:
-            ll = x['last-line']
+    # Do not format per-line debug messages when not debugging.
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 
-            if isinstance(ll, int) and ln > found + int(ll):
+    for ln, line in itertools.chain(before, lines):
+        if ex:
+            if last_num is not None and ln > last_num:
                 break
 
-            if isinstance(ll, str) and line.find(ll) >= 0:
+            if last_pat is not None and last_pat in line:
                 logging.debug(
                     f"{green}Found{normal} `{ll}' at line {ln}, `{line}'")
                 break
 
-            if ll is None and line == '':
+            if last_empty and line == '':
                 logging.debug(f"{green}Found{normal} empty line {ln}")
                 break
 
@@ -151,10 +156,13 @@ def extract(x: ExtractType, dirname: str) -> ElementType:
 
         # Extract this line.
         ex = True
-        logging.debug(f"Extracting line {ln}, `{line}'")
-        res += f"{line}\n"
 
-    return {'extract': res}
+        if debug:
+            logging.debug(f"Extracting line {ln}, `{line}'")
+
+        res.append(line)
+
+    return {'extract': '\n'.join(res) + '\n' if res else ''}
 
 
 # Perform analysis in one "sub".
@@ -196,50 +204,53 @@ def analyze_subs(
 
 
 # Output results to markdown report.
+# We format the whole report first and write it at once.
 def output_markdown(results: list[ElementType], filename: str) -> None:
     logging.debug(f"Output markdown `{filename}'")
+    t = []
+
+    for i, e in enumerate(results):
+        if i:
+            t.append('\n')
+
+        if 'heading' in e:
+            t.append(e['level'] * '#' + ' ' + e['heading'] + '\n')
+        elif 'extract' in e:
+            t.append(f"```\n{e['extract']}\n```\n")
+        elif 'paragraph' in e:
+            t.append(f"{e['paragraph']}\n")
+        else:
+            raise Exception
 
     with open(filename, 'w') as f:
-        for i, e in enumerate(results):
-            if i:
-                print('', file=f)
-
-            if 'heading' in e:
-                print(e['level'] * '#' + ' ' + e['heading'], file=f)
-            elif 'extract' in e:
-                print('```', file=f)
-                print(e['extract'], file=f)
-                print('```', file=f)
-            elif 'paragraph' in e:
-                print(e['paragraph'], file=f)
-            else:
-                raise Exception
+        f.write(''.join(t))
 
 
 # Output results for Jira.
+# We format the whole text first and write it at once.
 def output_jira(results: list[ElementType], filename: str) -> None:
     logging.debug(f"Output Jira-suitable text `{filename}'")
+    t = []
+
+    for e in results:
+        if 'heading' in e:
+            t.append(f"h{e['level']}. {e['heading']}\n\n")
+        elif 'extract' in e:
+            t.append(f"{{noformat}}\n{e['extract']}{{noformat}}\n")
+        elif 'paragraph' in e:
+            t.append(f"{e['paragraph']}\n")
+        else:
+            raise Exception
 
     with open(filename, 'w') as f:
-        for e in results:
-            if 'heading' in e:
-                print(f"h{e['level']}. {e['heading']}", file=f)
-                print('', file=f)
-            elif 'extract' in e:
-                print('{noformat}', file=f)
-                print(e['extract'], end='', file=f)
-                print('{noformat}', file=f)
-            elif 'paragraph' in e:
-                print(e['paragraph'], file=f)
-            else:
-                raise Exception
+        f.write(''.join(t))
 
 
 # Dump results.
 def output_dump(results: list[ElementType], filename: str) -> None:
     logging.debug(f"Dump to `{filename}'")
 
-    with open(filename, 'w') as f:
+    with open(filename, 'w', buffering=WRITE_BUFFER_SIZE) as f:
         pp = pprint.PrettyPrinter(stream=f)
         pp.pprint(results)
 
@@ -21,6 +21,8 @@ DbType = TypedDict('DbType', {
 
 # Validate YAML GUIDs database
 # We check our magic marker and also for duplicate guids or descriptions.
+# In the same pass, we create _Guid entries holding Guid objects, which also
+# verifies that all guids are valid.
 def validate_guids_db(db: DbType) -> None:
     logging.debug("Validate db")
 
@@ -47,15 +49,16 @@ def validate_guids_db(db: DbType) -> None:
 
         descrs[d] = g
         guids[g] = d
+        x['_Guid'] = guid.Guid(g)
 
 
 # Load YAML GUIDs database
-# We create _Guid entries holding Guid objects.
+# Validation creates _Guid entries holding Guid objects.
 def load_guids_db(filename: str) -> DbType:
     logging.debug(f"Load `{filename}'")
 
-    with open(filename, 'r') as yamlfile:
-        y = yaml.load(yamlfile, Loader=yaml.FullLoader)
+    with open(filename, 'rb') as yamlfile:
+        y = yaml.load(yamlfile, Loader=yaml.CSafeLoader)
         db = cast(Optional[DbType], y)
 
     if db is None:
@@ -65,11 +68,6 @@ def load_guids_db(filename: str) -> DbType:
 
     validate_guids_db(db)
     logging.debug(f"{len(db)} entries")
-
-    # Create _Guid entries holding Guid objects.
-    for x in db['known-guids']:
-        x['_Guid'] = guid.Guid(x['guid'])
-
     return db
 
 
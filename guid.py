@@ -4,9 +4,32 @@ import re
 from dataclasses import dataclass
 import uuid
 import datetime
+import struct
+from typing import Final
 
+# GUID string format, matched as a whole.
+GUID_RE: Final = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}',
+    re.IGNORECASE)
 
-@dataclass(frozen=True)
+# GUID bytes layout: three little-endian fields, then the clock sequence and
+# node bytes.
+GUID_STRUCT: Final = struct.Struct('<IHH2s6s')
+
+# The same layout in the big-endian order of the GUID strings.
+GUID_STRUCT_BE: Final = struct.Struct('>IHH2s6s')
+
+# GUID versions names.
+VERSION_NAMES: Final = {
+    1: 'time-based',
+    2: 'DCE security',
+    3: 'name-based MD5',
+    4: 'randomly generated',
+    5: 'name-based SHA-1'
+}
+
+
+@dataclass(frozen=True, slots=True)
 class Guid():
     """The Guid class handle UEFI GUIDs.
 
@@ -37,6 +60,14 @@ class Guid():
             ...
         ValueError: Invalid GUID string Hello
 
+        A trailing newline is not part of a valid GUID string.
+
+        >>> Guid('12345678-1234-4678-9234-56789abcdef0\\n')
+        Traceback (most recent call last):
+            ...
+        ValueError: Invalid GUID string 12345678-1234-4678-9234-56789abcdef0
+        <BLANKLINE>
+
         >>> Guid(b'42')
         Traceback (most recent call last):
             ...
@@ -106,41 +137,35 @@ class Guid():
             object.__setattr__(self, 'b', x)
 
         elif isinstance(x, str):
-            m = re.match(
-                r'([0-9a-f]{8})-([0-9a-f]{4})-([0-9a-f]{4})-([0-9a-f]{4})-'
-                r'([0-9a-f]{12})$',
-                x, re.IGNORECASE)
-
-            if not m:
+            if not GUID_RE.fullmatch(x):
                 raise ValueError(f"Invalid GUID string {x}")
 
-            r = bytearray()
-            r += int(m[1], base=16).to_bytes(4, byteorder='little')
-            r += int(m[2], base=16).to_bytes(2, byteorder='little')
-            r += int(m[3], base=16).to_bytes(2, byteorder='little')
-            r += int(m[4], base=16).to_bytes(2, byteorder='big')
-            r += bytes.fromhex(m[5])
-            object.__setattr__(self, 'b', bytes(r))
+            # The first three fields are little-endian; swap their bytes.
+            r = bytes.fromhex(x.replace('-', ''))
+            object.__setattr__(
+                self, 'b', GUID_STRUCT.pack(*GUID_STRUCT_BE.unpack(r)))
 
         else:
             raise TypeError(f"Invalid {x} of type {type(x)} for GUID")
 
-        u = self.as_uuid()
+        if not validate:
+            return
 
         # Verify variant.
-        var = u.variant
-
-        if validate and var != uuid.RFC_4122:
-            raise ValueError(f"GUID {self}: Bad variant {var}")
+        # The RFC 4122 variant has its two top bits set to 10, in the
+        # ClockSeqHighAndReserved byte; we only need a UUID to name others.
+        if self.b[8] & 0xc0 != 0x80:
+            raise ValueError(
+                f"GUID {self}: Bad variant {self.as_uuid().variant}")
 
         # Verify version.
         ver = self.get_version()
 
-        if validate and ver not in [1, 3, 4, 5]:
+        if ver not in [1, 3, 4, 5]:
             raise ValueError(f"GUID {self}: Bad version {ver}")
 
         # For version 1, verify that time is valid.
-        if validate and ver == 1:
+        if ver == 1:
             dt = self.get_datetime()
 
             if dt < datetime.datetime(1998, 1, 1):
@@ -165,8 +190,9 @@ class Guid():
         >>> print(g.get_version())
         12
         """
-        f = self.fields()
-        return (f[2] >> 12) & 0xf
+        # The version is the high nibble of the TimeHighAndVersion field,
+        # which is little-endian; that is its second byte.
+        return self.b[7] >> 4
 
     def __bytes__(self) -> bytes:
         """Return the GUID bytes, which we keep internally.
@@ -182,14 +208,8 @@ class Guid():
         >>> print(Guid('12345678-1234-4678-9234-56789abcdef0').fields())
         (305419896, 4660, 18040, 146, 52, 95075992133360)
         """
-        return (
-            int.from_bytes(self.b[0:4], byteorder='little'),
-            int.from_bytes(self.b[4:6], byteorder='little'),
-            int.from_bytes(self.b[6:8], byteorder='little'),
-            self.b[8],
-            self.b[9],
-            int.from_bytes(self.b[10:16], byteorder='big')
-        )
+        lo, mid, hi, cs, node = GUID_STRUCT.unpack(self.b)
+        return (lo, mid, hi, cs[0], cs[1], int.from_bytes(node, 'big'))
 
     def __str__(self) -> str:
         """Convert our GUID bytes to string.
@@ -202,11 +222,8 @@ class Guid():
         >>> print(Guid('09D7CF52-0720-4710-91D1-08469B7FE9C8'))
         09d7cf52-0720-4710-91d1-08469b7fe9c8
         """
-        f = self.fields()
-
-        return (
-            f'{f[0]:08x}-{f[1]:04x}-{f[2]:04x}-'
-            f'{f[3]:02x}{f[4]:02x}-{f[5]:012x}')
+        lo, mid, hi, cs, node = GUID_STRUCT.unpack(self.b)
+        return f'{lo:08x}-{mid:04x}-{hi:04x}-{cs.hex()}-{node.hex()}'
 
     def as_uuid(self) -> uuid.UUID:
         """Convert to UUID object.
@@ -214,7 +231,9 @@ class Guid():
         >>> print(repr(Guid('12345678-1234-4678-9234-56789abcdef0').as_uuid()))
         UUID('12345678-1234-4678-9234-56789abcdef0')
         """
-        return uuid.UUID(fields=self.fields())
+        # Our bytes are in the GUID mixed-endian layout, which is what uuid
+        # calls bytes_le.
+        return uuid.UUID(bytes_le=self.b)
 
     def get_datetime(self, validate: bool = True) -> datetime.datetime:
         """Get the time in our GUID as a naive datetime object.
@@ -238,14 +257,15 @@ class Guid():
         >>> g.get_datetime(validate=False)
         datetime.datetime(3059, 12, 7, 20, 53, 48, 586560)
         """
-        u = self.as_uuid()
         ver = self.get_version()
 
         if validate and ver != 1:
             raise ValueError(
                 f"GUID {self}: Invalid get_datetime with version {ver}")
 
-        ns100 = u.time
+        # The 60-bit timestamp is spread over the three little-endian fields.
+        lo, mid, hi, _, _ = GUID_STRUCT.unpack(self.b)
+        ns100 = ((hi & 0xfff) << 48) | (mid << 32) | lo
 
         return (datetime.datetime(1582, 10, 15)
                 + datetime.timedelta(microseconds=ns100 / 10))
@@ -287,16 +307,7 @@ class Guid():
         f = self.fields()
         u = self.as_uuid()
         ver = self.get_version()
-
-        vnames = {
-            1: 'time-based',
-            2: 'DCE security',
-            3: 'name-based MD5',
-            4: 'randomly generated',
-            5: 'name-based SHA-1'
-        }
-
-        vname = vnames[ver] if ver in vnames else 'Unknown'
+        vname = VERSION_NAMES.get(ver, 'Unknown')
 
         r = (
             f"GUID: {self}\n"
@@ -338,19 +349,13 @@ class Guid():
         {0x12345678, 0x1234, 0x4678, \\
         {0x92, 0x34, 0x06, 0x78, 0x9a, 0xbc, 0xde, 0xf0}}
         """
-        f = self.fields()
-        a = self.b[10]
-        b = self.b[11]
-        c = self.b[12]
-        d = self.b[13]
-        e = self.b[14]
-        g = self.b[15]
+        lo, mid, hi, _, _ = GUID_STRUCT.unpack(self.b)
+        t = ', '.join(f'{x:#04x}' for x in self.b[8:])
 
         return (
             f"#define {define_name} \\\n"
-            f"{{{f[0]:#010x}, {f[1]:#06x}, {f[2]:#06x}, \\\n"
-            f"{{{f[3]:#04x}, {f[4]:#04x}, "
-            f"{a:#04x}, {b:#04x}, {c:#04x}, {d:#04x}, {e:#04x}, {g:#04x}}}}}")
+            f"{{{lo:#010x}, {mid:#06x}, {hi:#06x}, \\\n"
+            f"{{{t}}}}}")
 
 
 if __name__ == '__main__':
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
 import logging
 import os
 import hashlib
-from typing import Optional, cast, TypedDict
+import re
+from typing import Optional, cast, TypedDict, Final
 import yaml
 
 
@@ -28,6 +30,12 @@ DbType = TypedDict('DbType', {
 CacheType = dict[str, str]
 FilesType = list[dict[str, str]]
 
+# Size of the buffer used to hash files in chunks.
+HASH_BUFFER_SIZE: Final = 1 << 20
+
+# Size of the chunks read when searching for strings in files.
+SEARCH_BUFFER_SIZE: Final = 1 << 20
+
 
 # Validate YAML identify database
 # We check our magic marker.
@@ -40,8 +48,8 @@ def validate_identify_db(db: DbType) -> None:
 def load_identify_db(filename: str) -> DbType:
     logging.debug(f"Load `{filename}'")
 
-    with open(filename, 'r') as yamlfile:
-        y = yaml.load(yamlfile, Loader=yaml.FullLoader)
+    with open(filename, 'rb') as yamlfile:
+        y = yaml.load(yamlfile, Loader=yaml.CSafeLoader)
         db = cast(Optional[DbType], y)
 
     if db is None:
@@ -67,14 +75,20 @@ def load_identify_db(filename: str) -> DbType:
 # Return the hash.
 def hash_file(filename: str) -> str:
     logging.debug(f"Hash `{filename}'")
-    hm = 'sha256'
-    hl = hashlib.new(hm)
+
+    # Use the sha256 constructor directly rather than looking it up by name.
+    hl = hashlib.sha256()
+
+    # Hash the file in chunks, reusing the same buffer.
+    mv = memoryview(bytearray(HASH_BUFFER_SIZE))
 
     with open(filename, 'rb') as f:
-        hl.update(f.read())
+        while n := f.readinto(mv):
+            hl.update(mv[:n])
 
     h = hl.hexdigest()
-    logging.debug(f"{hm} {h} {filename}")
+
+    logging.debug(f"sha256 {h} {filename}")
     return h
 
 
@@ -102,17 +116,50 @@ def search_file(filename: str, strings: list[str]) -> list[str]:
     # to remove them like with a set().
     remain = dict.fromkeys(strings)
 
-    with open(filename, 'r') as f:
-        for i, line in enumerate(f):
-            line = line.rstrip()
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 
-            for s in list(remain):
-                if s in line:
-                    logging.debug(f"""Found "{s}" at line {i + 1}: `{line}'""")
-                    del remain[s]
+    # We read the file in chunks, and keep the end of the previous chunk to
+    # find the strings spanning two chunks.
+    overlap = max((len(s.encode()) for s in strings), default=1) - 1
+    buf = b''
+    lineno = 1
 
-            if len(remain) == 0:
-                break
+    with open(filename, 'rb') as f:
+        while len(remain) and (chunk := f.read(SEARCH_BUFFER_SIZE)):
+            buf += chunk
+            pos = 0
+
+            # Search for all the remaining strings at once with a single
+            # regular expression. We restart from the beginning of each
+            # match, as another string could match at the same position.
+            while len(remain):
+                r = re.compile(
+                    b'|'.join(re.escape(s.encode()) for s in remain))
+                m = r.search(buf, pos)
+
+                if m is None:
+                    break
+
+                pos = m.start()
+                s = m[0].decode()
+
+                if debug:
+                    # The line may be truncated at the chunk boundaries.
+                    i = lineno + buf.count(b'\n', 0, pos)
+                    start = buf.rfind(b'\n', 0, pos) + 1
+                    end = buf.find(b'\n', pos)
+                    line = buf[start:end if end >= 0 else None].decode(
+                        errors='replace').rstrip()
+                    logging.debug(f"""Found "{s}" at line {i}: `{line}'""")
+
+                del remain[s]
+
+            cut = max(len(buf) - overlap, 0)
+
+            if debug:
+                lineno += buf.count(b'\n', 0, cut)
+
+            buf = buf[cut:]
 
     ret = list(remain.keys())
 
@@ -130,28 +177,62 @@ def search_file(filename: str, strings: list[str]) -> list[str]:
 #   'name': The file identifier.
 def identify_files(db: DbType, dirname: str) -> FilesType:
     logging.debug(f"Identify files in `{dirname}/'")
+    known_files = db['known-files']
     h_cache: CacheType = {}
-    r = []
 
-    for x in db['known-files']:
-        filename = f"{dirname}/{x['path']}"
+    # Group the known-files entries indexes by path, so that we look at each
+    # file only once.
+    by_path: dict[str, list[int]] = {}
+
+    for i, x in enumerate(known_files):
+        by_path.setdefault(x['path'], []).append(i)
+
+    # Indexes of the identified known-files entries.
+    found: list[int] = []
+
+    # For each file to hash, index its entries by sha256, to resolve its hash
+    # with a single lookup.
+    by_sha: dict[str, dict[str, list[int]]] = {}
+
+    for path, indexes in by_path.items():
+        filename = f"{dirname}/{path}"
 
         if not os.path.isfile(filename):
             continue
 
-        if 'sha256' in x:
-            if x['sha256'] == hash_file_cached(filename, h_cache):
-                logging.debug(f"""Identified `{filename}' as "{x['name']}".""")
-                r.append({'path': filename, 'name': x['name']})
+        for i in indexes:
+            x = known_files[i]
+
+            if 'sha256' in x:
+                by_sha.setdefault(filename, {}).setdefault(
+                    x['sha256'], []).append(i)
 
-        if 'search' in x:
-            search = x['search']
-            # This does not benefit from caching.
-            remain = search_file(filename, search)
+            if 'search' in x:
+                search = x['search']
+                # This does not benefit from caching.
+                remain = search_file(filename, search)
 
-            if len(remain) == 0:
-                logging.debug(f"""Identified `{filename}' as "{x['name']}".""")
-                r.append({'path': filename, 'name': x['name']})
+                if len(remain) == 0:
+                    found.append(i)
+
+    # Hash all the files in parallel to fill the cache.
+    # hashlib releases the GIL while hashing.
+    filenames = list(by_sha.keys())
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        h_cache.update(zip(filenames, executor.map(hash_file, filenames)))
+
+    for filename, shas in by_sha.items():
+        found += shas.get(hash_file_cached(filename, h_cache), [])
+
+    # Return the identified files in the database order.
+    r = []
+
+    for i in sorted(found):
+        x = known_files[i]
+        filename = f"{dirname}/{x['path']}"
+        logging.debug(f"""Identified `{filename}' as "{x['name']}".""")
+        r.append({'path': filename, 'name': x['name']})
 
     if len(r) == 0:
         logging.debug('Could not identify any file...')
@@ -159,15 +240,15 @@ def identify_files(db: DbType, dirname: str) -> FilesType:
     return r
 
 
-# Search for a (sub-)string in a list of strings
+# Search for a (sub-)string in a haystack of strings joined with NUL
+# characters, which can not be part of the strings.
 # Return True if found or False when not found.
-def find_substr(s: str, strings: list[str]) -> bool:
-    logging.debug(f"Search for `{s}' in {strings}")
+def find_substr(s: str, haystack: str) -> bool:
+    logging.debug(f"Search for `{s}'")
 
-    for x in strings:
-        if x.find(s) >= 0:
-            logging.debug(f"Found in `{x}'")
-            return True
+    if s in haystack:
+        logging.debug('Found')
+        return True
 
     logging.debug('Not found...')
     return False
@@ -177,7 +258,9 @@ def find_substr(s: str, strings: list[str]) -> bool:
 # Return None when unknown.
 def identify_ver(db: DbType, files: FilesType) -> Optional[str]:
     logging.debug(f"Identify ver from {files}")
-    found_names = list(map(lambda f: f['name'], files))
+    # Join all the names once, to search for sub-strings in all of them at
+    # once.
+    found_names = '\0'.join(f['name'] for f in files)
 
     for x in db['versions']:
         found = True
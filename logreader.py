@@ -3,8 +3,9 @@
 import logging
 import re
 import collections.abc
+import itertools
 import sys
-from typing import Optional, Iterator, IO
+from typing import Optional, Iterator, IO, Final
 from chardet.universaldetector import UniversalDetector
 
 # Maximum number of lines to examine for file encoding detection.
@@ -13,17 +14,42 @@ detect_file_encoding_limit = 999
 # Maximum number of iterations for line cleanup.
 cleanup_line_limit = 99
 
+# Bytes which can make chardet conclude on ASCII data: NUL characters for
+# UTF-16 and UTF-32, and escape sequences for HZ and ISO-2022 encodings.
+CHARDET_ASCII_RE: Final = re.compile(rb'[\x00\x1B]|~{')
+
+# All the escape sequences and bells to remove, in a single pattern.
+ESCAPES_RE: Final = re.compile(
+    r'\x1B(?:\[[\x30-\x3F]*[\x20-\x2F]*[\x40-\x7E]|\(B)|\x07')
+
+# Escape sequences and control characters to cleanup, compiled once.
+ERASE_LINE_RE: Final = re.compile(r'\x1B\[K')
+CHARSET_RE: Final = re.compile(r'\x1B\(B')
+BELL_RE: Final = re.compile(r'\x07')
+CSI_RE: Final = re.compile(r'\x1B\[[\x30-\x3F]*[\x20-\x2F]*[\x40-\x7E]')
+BS_OR_CR_RE: Final = re.compile(r'\x08|\r')
+
 
 # Detect file encoding
 # We return the encoding or None
 def logreader_detect_file_encoding(filename: str) -> Optional[str]:
     logging.debug(f"Detect encoding of `{filename}'")
 
-    detector = UniversalDetector()
+    with open(filename, 'rb') as f:
+        lines = list(itertools.islice(f, detect_file_encoding_limit + 2))
+
     enc = None
 
-    with open(filename, 'rb') as f:
-        for i, line in enumerate(f):
+    # chardet never concludes on plain ASCII data, so we skip it entirely in
+    # that case, which is the most common.
+    data = b''.join(lines)
+
+    if data.isascii() and not CHARDET_ASCII_RE.search(data):
+        logging.debug('Plain ASCII')
+    else:
+        detector = UniversalDetector()
+
+        for i, line in enumerate(lines):
             detector.feed(line)
 
             if detector.done:
@@ -46,33 +72,60 @@ def logreader_detect_file_encoding(filename: str) -> Optional[str]:
 # If we reach the limit, stop and truncate the unclean right part.
 def logreader_cleanup_line(line: str) -> str:
     line = line.rstrip()
-    line = re.sub(r'\x1B\[K', '', line)
-    line = re.sub(r'\x1B\(B', '', line)
-    line = re.sub(r'\x07', '', line)
-    line = re.sub(r'\x1B\[[\x30-\x3F]*[\x20-\x2F]*[\x40-\x7E]', '', line)
-    i = 0
 
-    while True:
-        m = re.search(r'\x08|\r', line)
+    # Remove all the escape sequences and bells in a single pass.
+    # If an escape character remains, some sequences were broken by other
+    # control characters; remove each kind in turn then, as their removal
+    # can form new sequences.
+    cleaned = ESCAPES_RE.sub('', line)
+
+    if '\x1B' in cleaned:
+        cleaned = ERASE_LINE_RE.sub('', line)
+        cleaned = CHARSET_RE.sub('', cleaned)
+        cleaned = BELL_RE.sub('', cleaned)
+        cleaned = CSI_RE.sub('', cleaned)
+
+    line = cleaned
+    m = BS_OR_CR_RE.search(line)
+
+    # Apply carriage returns and backspaces in a single pass from left to
+    # right, keeping the characters of the cleaned-up part in a list.
+    if m:
+        out: list[str] = []
+        pos = 0
+        i = 0
+
+        while m:
+            out.extend(line[pos:m.start()])
+
+            if i > cleanup_line_limit:
+                logging.debug('Giving up; truncating')
+                out.extend('(snip)')
+                pos = len(line)
+                break
 
-        if not m:
-            break
+            pos = m.end()
 
-        if i > cleanup_line_limit:
-            logging.debug('Giving up; truncating')
-            line = line[:m.start()] + '(snip)'
-            break
+            if m[0] == '\r':
+                out.clear()
+            elif m[0] == '\x08':
+                # A backspace removes the previous character, if any.
+                # Otherwise it removes the next character if it is another
+                # backspace.
+                if out and out[-1] != '\n':
+                    out.pop()
+                elif line.startswith('\x08', pos):
+                    pos += 1
+            else:
+                raise Exception(f"Bad match {m[0]}")
 
-        if m[0] == '\r':
-            line = line[m.start() + 1:]
-        elif m[0] == '\x08':
-            line = re.sub(r'.?\x08', '', line, count=1)
-        else:
-            raise Exception(f"Bad match {m[0]}")
+            i += 1
+            m = BS_OR_CR_RE.search(line, pos)
 
-        i += 1
+        out.extend(line[pos:])
+        line = ''.join(out)
 
-    line = re.sub(r'\x00', ' ', line)
+    line = line.replace('\x00', ' ')
     return line
 
 
@@ -1,33 +1,20 @@
 #!/usr/bin/env python3
 
 import argparse
-import sys
 import os
 import logging
 from typing import Any
 import yaml
 import jsonschema
 
-try:
-    from packaging import version
-except ImportError:
-    print('No packaging. You should install python3-packaging...')
-
-# Not all yaml versions have a Loader argument.
-if 'packaging.version' in sys.modules and \
-   version.parse(yaml.__version__) >= version.parse('5.1'):
-    yaml_load_args = {'Loader': yaml.FullLoader}
-else:
-    yaml_load_args = {}
-
 # The folder of the schema.
 schema_folder = None
 
 
 def load_yaml(filename: str) -> Any:
     logging.debug(f"Loading `{filename}'")
-    with open(filename, 'r') as f:
-        return yaml.load(f, **yaml_load_args)
+    with open(filename, 'rb') as f:
+        return yaml.load(f, Loader=yaml.CSafeLoader)
 
 
 def handler(uri: str) -> Any: